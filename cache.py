@@ -0,0 +1,86 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+# Persistent on-disk caches shared across runs: LLM outputs and embeddings,
+# scraped pages, and the NewsAPI response file all live under CACHE_DIR
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache')
+TTL = 7 * 86400  # seconds
+
+os.makedirs(CACHE_DIR, exist_ok=True)
+db = sqlite3.connect(os.path.join(CACHE_DIR, 'cache.sqlite'), check_same_thread=False)
+db.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT, ts INTEGER)")
+db.execute("DELETE FROM cache WHERE ts <= ?", (int(time.time()) - TTL,))
+lock = threading.Lock()
+
+# Semantic cache: embeddings of summarized articles, so near-duplicate coverage of
+# the same story from another outlet reuses the earlier summary and title. Rows
+# carry a fingerprint of the request that produced them (everything but the
+# article text) and expire after TTL, like the exact cache.
+db.execute("CREATE TABLE IF NOT EXISTS semantic_cache (fingerprint TEXT, embedding BLOB, summary TEXT, title TEXT, ts INTEGER)")
+db.execute("DELETE FROM semantic_cache WHERE ts <= ?", (int(time.time()) - TTL,))
+db.commit()
+semantic_entries = [
+    {'fingerprint': row[0], 'embedding': np.frombuffer(row[1], dtype=np.float16), 'result': {'summary': row[2], 'title': row[3]}, 'ts': row[4]}
+    for row in db.execute("SELECT fingerprint, embedding, summary, title, ts FROM semantic_cache")
+]
+
+# Scraped article text with the validators it was served with, so unchanged
+# pages are revalidated with a conditional request instead of re-downloaded.
+# Rows record the extractor version that produced the text and expire after
+# TTL, so an extraction change or a long-lived stale copy forces a full fetch.
+db.execute("CREATE TABLE IF NOT EXISTS scraped_pages (url TEXT PRIMARY KEY, extractor TEXT, etag TEXT, last_modified TEXT, text TEXT, ts INTEGER)")
+db.execute("DELETE FROM scraped_pages WHERE ts <= ?", (int(time.time()) - TTL,))
+db.commit()
+
+def make_key(request):
+    # Hash every request parameter, so any prompt or setting change is a miss
+    return hashlib.sha256(json.dumps(request, sort_keys=True).encode()).hexdigest()
+
+def get(key):
+    with lock:
+        row = db.execute("SELECT value FROM cache WHERE key = ? AND ts > ?", (key, int(time.time()) - TTL)).fetchone()
+    return row[0] if row else None
+
+def put(key, value):
+    with lock:
+        db.execute("INSERT OR REPLACE INTO cache VALUES (?, ?, ?)", (key, value, int(time.time())))
+        db.commit()
+
+def semantic_get(fingerprint, embedding, threshold):
+    cutoff = int(time.time()) - TTL
+    with lock:
+        candidates = [entry for entry in semantic_entries if entry['fingerprint'] == fingerprint and entry['ts'] > cutoff]
+    if not candidates:
+        return None
+    # OpenAI embeddings are unit length, so the dot product is the cosine similarity
+    sims = np.array([entry['embedding'] for entry in candidates], dtype=np.float32) @ embedding.astype(np.float32)
+    best = int(sims.argmax())
+    if sims[best] > threshold:
+        return candidates[best]['result']
+    return None
+
+def semantic_put(fingerprint, embedding, result):
+    ts = int(time.time())
+    with lock:
+        db.execute("INSERT INTO semantic_cache VALUES (?, ?, ?, ?, ?)", (fingerprint, embedding.tobytes(), result['summary'], result['title'], ts))
+        db.commit()
+        semantic_entries.append({'fingerprint': fingerprint, 'embedding': embedding, 'result': result, 'ts': ts})
+
+def page_get(url, extractor):
+    with lock:
+        row = db.execute(
+            "SELECT etag, last_modified, text FROM scraped_pages WHERE url = ? AND extractor = ? AND ts > ?",
+            (url, extractor, int(time.time()) - TTL)
+        ).fetchone()
+    return {'etag': row[0], 'last_modified': row[1], 'text': row[2]} if row else None
+
+def page_put(url, extractor, etag, last_modified, text):
+    with lock:
+        db.execute("INSERT OR REPLACE INTO scraped_pages VALUES (?, ?, ?, ?, ?, ?)", (url, extractor, etag, last_modified, text, int(time.time())))
+        db.commit()
@@ -1,13 +1,28 @@
 #!/usr/bin/python
 
 import requests
-from bs4 import BeautifulSoup # type: ignore
-from openai import OpenAI # type: ignore
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from urllib3.util.request import ACCEPT_ENCODING
+from selectolax.lexbor import LexborHTMLParser # type: ignore
+import numpy as np
+import tiktoken # type: ignore
+from openai import OpenAI, DefaultHttpxClient # type: ignore
 from datetime import datetime, timedelta, timezone
+from urllib.parse import urlparse, parse_qsl, urlencode
 import os
+import re
+import json
+import time
+import tempfile
+import sqlite3
 import subprocess
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from functools import partial, lru_cache
 import logging
+import threading
+
+import cache
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -16,14 +31,106 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 NEWS_API_KEY = os.getenv('NEWS_API_KEY')
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
 
-# Set the API key for OpenAI
-client = OpenAI(api_key=OPENAI_API_KEY)
+# Local clone of the blog repository that posts are written to and pushed from
+BLOG_REPO_DIR = "/root/cybersecurity-news"
+
+# Set the API key for OpenAI; the SDK retries 429/5xx with backoff, honouring Retry-After.
+# Concurrent calls share HTTP/2 streams on a kept-alive connection to the API
+# instead of each opening its own TLS connection. HTTP/2 needs the optional h2
+# package; without it calls go over pooled HTTP/1.1 connections instead.
+try:
+    http_client = DefaultHttpxClient(http2=True)
+except ImportError:
+    logging.info("h2 is not installed, using HTTP/1.1 for OpenAI calls")
+    http_client = DefaultHttpxClient()
+client = OpenAI(api_key=OPENAI_API_KEY, max_retries=3, timeout=60, http_client=http_client)
+
+# Worker threads for the per-article scrape + summarize pipeline. The work is
+# network-bound, so this is sized to HTTP/API concurrency, not cpu_count().
+MAX_WORKERS = int(os.getenv('SCRAPE_WORKERS', '16'))
+
+# Shared HTTP session so every fetch reuses pooled keep-alive connections.
+# Each host keeps up to MAX_WORKERS idle connections, so concurrent articles from
+# the same site all return their sockets to the pool instead of discarding them.
+SESSION = requests.Session()
+SESSION.headers['User-Agent'] = 'blogbot/1.0'
+# gzip/deflate, plus br when a brotli decoder is installed for urllib3 to use
+SESSION.headers['Accept-Encoding'] = ACCEPT_ENCODING
+adapter = HTTPAdapter(
+    pool_connections=32,  # distinct hosts kept pooled: ~20 news sites plus NewsAPI
+    pool_maxsize=MAX_WORKERS,
+    max_retries=Retry(
+        total=3,
+        connect=3,
+        read=2,
+        status=3,
+        backoff_factor=0.5,
+        status_forcelist=(429, 502, 503, 504),
+        allowed_methods=('GET',),
+        respect_retry_after_header=True
+    )
+)
+SESSION.mount('https://', adapter)
+SESSION.mount('http://', adapter)
+HTTP_TIMEOUT = (3.05, 15)  # (connect, read) seconds
+MAX_PAGE_BYTES = 512_000  # article pages are only read up to this size
+MIN_PARAGRAPH_CHARS = 20  # shorter <p> text is usually nav/footer/caption noise
+# Bump whenever extract_paragraph_text changes, so cached pages are re-extracted
+EXTRACTOR_VERSION = "lexbor-p-1"
+
+# NewsAPI cuts 'content' to ~200 chars and appends a marker like "[+1234 chars]";
+# only content without the marker is the complete article and can skip scraping
+TRUNCATION_MARKER = re.compile(r'\s*\[\+\d+ chars\]$')
+# Complete NewsAPI content shorter than this is a teaser, so the page is scraped
+MIN_CONTENT_CHARS = int(os.getenv('MIN_CONTENT_CHARS', '500'))
+# NewsAPI's placeholder title and content for articles that were taken down
+REMOVED_PLACEHOLDER = '[Removed]'
+
+# Caps concurrent OpenAI requests across worker threads to stay under rate limits
+OPENAI_CONCURRENCY = int(os.getenv('OPENAI_CONCURRENCY', '10'))
+OPENAI_SEMAPHORE = threading.BoundedSemaphore(OPENAI_CONCURRENCY)
+
+CHAT_MODEL = "gpt-4o-mini"
+# Room for a ~220-token summary, a ~32-token title and the JSON around them
+SUMMARY_MAX_TOKENS = 300
+# Article text beyond this many tokens adds cost and latency, not summary quality
+MAX_ARTICLE_TOKENS = 1500
+# Rough size of a token in English text, for when the tokenizer is unavailable
+CHARS_PER_TOKEN = 4
+
+# Static instructions go first as the system message, identical on every call;
+# per-article text only ever appears after it in the user message.
+SUMMARY_INSTRUCTION = "As a cybersecurity professional that is trying to help other cyber professionals understand the latest cybersecurity news, summarize the article provided by the user, focusing on the most important and relevant point when an article covers several topics, but without pointing it out as the most important and relevant. Keep the summary under 150 words. Then generate a concise and compelling title for that summary, no longer than 12 words. Respond with a JSON object with the keys \"summary\" and \"title\"."
+
+NEWSAPI_CACHE_TTL = 3600  # seconds
+
+EMBEDDING_MODEL = "text-embedding-3-small"
+# Articles at least this similar to a cached one reuse its summary and title
+SEMANTIC_CACHE_THRESHOLD = 0.92
+
+# Articles are ranked by the similarity of their title and summary to this description
+RELEVANCE_QUERY = "Important news for cybersecurity professionals about a single event: a newly disclosed vulnerability, data breach, cyberattack, or threat actor campaign."
+TOP_ARTICLES = 8
+# Only this many articles, ranked on NewsAPI title + description, get scraped
+PRESELECT_ARTICLES = int(os.getenv('PRESELECT_ARTICLES', '12'))
 
-def fetch_top_articles():
+def write_json_atomic(path, data):
+    # Write to a temp file in the same directory, then rename over the target,
+    # so a crash mid-write never leaves a truncated cache file behind
+    with tempfile.NamedTemporaryFile('w', dir=os.path.dirname(path), delete=False, encoding='utf-8') as f:
+        json.dump(data, f)
+    os.replace(f.name, path)
+
+def fetch_top_articles(yesterday):
     logging.info("Fetching top articles...")
+    cache_path = os.path.join(cache.CACHE_DIR, f"newsapi-{yesterday}.json")
+    if os.path.exists(cache_path) and time.time() - os.path.getmtime(cache_path) < NEWSAPI_CACHE_TTL:
+        with open(cache_path, encoding='utf-8') as f:
+            articles = json.load(f)
+        logging.info(f"Loaded {len(articles)} articles from cache.")
+        return articles
     try:
         url = 'https://newsapi.org/v2/everything'
-        yesterday = (datetime.now(timezone.utc) - timedelta(days=1)).strftime('%Y-%m-%d')
         params = {
             'q': 'cybersecurity',
             'from': yesterday,
@@ -33,119 +140,226 @@ def fetch_top_articles():
             'apiKey': NEWS_API_KEY,
             'language': 'en'  # Ensures articles are in English
         }
-        response = requests.get(url, params=params)
+        response = SESSION.get(url, params=params, timeout=HTTP_TIMEOUT)
         response.raise_for_status()
         articles = response.json().get('articles', [])
         logging.info(f"Fetched {len(articles)} articles.")
-        return articles
     except requests.exceptions.RequestException as e:
         logging.error(f"Error fetching articles: {e}")
         return []
+    try:
+        write_json_atomic(cache_path, articles)
+    except OSError as e:
+        logging.error(f"Error caching articles: {e}")
+    return articles
+
+def canonical_url(url):
+    parts = urlparse(url)
+    query = urlencode([(k, v) for k, v in parse_qsl(parts.query) if not k.lower().startswith('utm_')])
+    return parts._replace(query=query, fragment='').geturl().lower()
 
-def scrape_article_content(url):
+def deduplicate_articles(articles):
+    # Syndicated copies of the same story share a URL or title; scrape each once
+    seen = set()
+    unique = []
+    for article in articles:
+        if article.get('title') == REMOVED_PLACEHOLDER or article.get('content') == REMOVED_PLACEHOLDER:
+            continue
+        url_key = canonical_url(article['url'])
+        title_key = (article.get('title') or '').strip().lower()
+        if url_key in seen or (title_key and title_key in seen):
+            continue
+        seen.update((url_key, title_key))
+        unique.append(article)
+    logging.info(f"Removed {len(articles) - len(unique)} duplicate or removed articles.")
+    return unique
+
+def extract_paragraph_text(html):
+    tree = LexborHTMLParser(html)
+    paragraphs = (node.text().strip() for node in tree.css('p'))
+    return ' '.join(text for text in paragraphs if len(text) > MIN_PARAGRAPH_CHARS)
+
+def scrape_article_content(url, parse_pool):
     logging.info(f"Scraping content from {url}...")
     try:
-        response = requests.get(url)
-        response.raise_for_status()
-        soup = BeautifulSoup(response.content, 'html.parser')
-        paragraphs = soup.find_all('p')
-        full_text = ' '.join([para.text for para in paragraphs])
+        cached = cache.page_get(url, EXTRACTOR_VERSION)
+        headers = {}
+        if cached is not None:
+            if cached['etag']:
+                headers['If-None-Match'] = cached['etag']
+            if cached['last_modified']:
+                headers['If-Modified-Since'] = cached['last_modified']
+        with SESSION.get(url, headers=headers, stream=True, timeout=HTTP_TIMEOUT) as response:
+            response.raise_for_status()
+            if response.status_code == 304:
+                logging.info(f"Content from {url} unchanged, using cached copy")
+                return cached['text']
+            etag = response.headers.get('ETag', '')
+            last_modified = response.headers.get('Last-Modified', '')
+            body = bytearray()
+            for chunk in response.iter_content(chunk_size=65536):
+                body.extend(chunk)
+                if len(body) >= MAX_PAGE_BYTES:
+                    break
+        # Parsing is CPU-bound, so it runs in another process instead of holding the GIL
+        try:
+            full_text = parse_pool.submit(extract_paragraph_text, bytes(body)).result()
+        except Exception as e:
+            logging.error(f"Error parsing article content from {url}: {e}")
+            return ""
+        if etag or last_modified:
+            cache.page_put(url, EXTRACTOR_VERSION, etag, last_modified, full_text)
         logging.info(f"Scraped content from {url}")
         return full_text
-    except requests.exceptions.RequestException as e:
+    except (requests.exceptions.RequestException, sqlite3.Error) as e:
         logging.error(f"Error scraping article content from {url}: {e}")
         return ""
 
-def summarize_article(article_text):
+def embed_texts(texts):
+    with OPENAI_SEMAPHORE:
+        response = client.embeddings.create(model=EMBEDDING_MODEL, input=[text[:2000] for text in texts])
+    return np.array([item.embedding for item in response.data], dtype=np.float32)
+
+def embed_text(text):
+    return embed_texts([text])[0].astype(np.float16)
+
+def relevance_query_embedding():
+    key = cache.make_key({"model": EMBEDDING_MODEL, "input": RELEVANCE_QUERY})
+    cached = cache.get(key)
+    if cached is not None:
+        return np.array(json.loads(cached), dtype=np.float32)
+    embedding = embed_texts([RELEVANCE_QUERY])[0]
+    cache.put(key, json.dumps(embedding.tolist()))
+    return embedding
+
+def rank_by_relevance(texts, limit):
+    scores = embed_texts(texts) @ relevance_query_embedding()
+    return np.argsort(-scores)[:limit]
+
+def preselect_articles(articles):
+    logging.info("Preselecting articles...")
+    if len(articles) <= PRESELECT_ARTICLES:
+        return articles
+    try:
+        texts = [f"{article.get('title') or ''}. {article.get('description') or ''}" for article in articles]
+        selected = [articles[i] for i in rank_by_relevance(texts, PRESELECT_ARTICLES)]
+        logging.info(f"Preselected {len(selected)} of {len(articles)} articles.")
+        return selected
+    except Exception as e:
+        logging.error(f"Error preselecting articles: {e}")
+        return articles
+
+def summarize_and_title(article_text):
     logging.info("Summarizing article...")
+    request = {
+        "model": CHAT_MODEL,
+        "messages": [
+            {"role": "system", "content": SUMMARY_INSTRUCTION},
+            {"role": "user", "content": article_text}
+        ],
+        "response_format": {"type": "json_object"},
+        "temperature": 0,
+        "max_tokens": SUMMARY_MAX_TOKENS,
+    }
+    key = cache.make_key(request)
+    cached = cache.get(key)
+    if cached is not None:
+        logging.info("Article summary loaded from cache.")
+        return json.loads(cached)
+    # Everything that shapes the output except the article itself, so a model or
+    # instruction change never reuses summaries made under the old settings
+    fingerprint = cache.make_key({**request, "messages": request["messages"][:-1], "embedding_model": EMBEDDING_MODEL})
+    # The semantic cache is only a shortcut, so a failed embedding or lookup
+    # falls through to the completion instead of dropping the article
+    embedding = None
+    try:
+        embedding = embed_text(article_text)
+        similar = cache.semantic_get(fingerprint, embedding, SEMANTIC_CACHE_THRESHOLD)
+        if similar is not None:
+            logging.info("Reusing summary of a near-duplicate article.")
+            return similar
+    except Exception as e:
+        logging.error(f"Error checking semantic cache: {e}")
     try:
-        stream = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {
-                    "role": "user",
-                    "content": f"As a cybersecurity professional that is trying to help other cyber professionals understand the latest cybersecurity news, summarize this article, focusing on the most important and relevant point when an article covers several topics, but without pointing it out as the most important and relevant:\n\n{article_text}"
-                }
-            ],
-            stream=True,
-        )
-        summary = ""
-        for chunk in stream:
-            if chunk.choices[0].delta.content is not None:
-                summary += chunk.choices[0].delta.content
-        logging.info("Article summarized.")
-        return summary
+        with OPENAI_SEMAPHORE:
+            response = client.chat.completions.create(**request)
+        if response.choices[0].finish_reason == 'length':
+            # Cut off at max_tokens, so the JSON is incomplete
+            logging.error(f"Summary hit the {SUMMARY_MAX_TOKENS}-token limit and was truncated.")
+            return None
+        parsed = json.loads(response.choices[0].message.content)
+        result = {'summary': parsed['summary'], 'title': parsed['title'].strip()}
     except Exception as e:
         logging.error(f"Error summarizing article: {e}")
-        return "Summary unavailable due to an error."
+        return None
+    try:
+        cache.put(key, json.dumps(result))
+        if embedding is not None:
+            cache.semantic_put(fingerprint, embedding, result)
+    except Exception as e:
+        logging.error(f"Error caching article summary: {e}")
+    logging.info("Article summarized.")
+    return result
 
-def generate_new_title(summary_text):
-    logging.info("Generating new title...")
+@lru_cache(maxsize=None)
+def token_encoding():
+    # tiktoken downloads the encoding on first use, so load it only when needed
+    # and remember a failure instead of retrying the download for every article
     try:
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {
-                    "role": "user",
-                    "content": f"Generate a concise and compelling title for the following summary:\n\n{summary_text}"
-                }
-            ],
-            stream=True,
-        )
-        new_title = ""
-        for chunk in response:
-            if chunk.choices[0].delta.content is not None:
-                new_title += chunk.choices[0].delta.content
-        logging.info("New title generated.")
-        return new_title.strip()
+        return tiktoken.encoding_for_model(CHAT_MODEL)
     except Exception as e:
-        logging.error(f"Error generating new title: {e}")
-        return "Title unavailable due to an error."
+        logging.error(f"Error loading tokenizer, truncating by characters instead: {e}")
+        return None
+
+def truncate_tokens(text, max_tokens):
+    encoding = token_encoding()
+    if encoding is None:
+        return text[:max_tokens * CHARS_PER_TOKEN]
+    tokens = encoding.encode(text)
+    if len(tokens) <= max_tokens:
+        return text
+    return encoding.decode(tokens[:max_tokens])
 
-def process_article(article):
+def process_article(article, parse_pool):
     logging.info(f"Processing article: {article['title']}")
-    full_text = scrape_article_content(article['url'])
+    full_text = (article.get('content') or '').strip()
+    if len(full_text) >= MIN_CONTENT_CHARS and not TRUNCATION_MARKER.search(full_text):
+        logging.info(f"Using NewsAPI content for {article['url']}")
+    else:
+        full_text = scrape_article_content(article['url'], parse_pool)
     if full_text:
-        summary = summarize_article(full_text)
-        new_title = generate_new_title(summary)
+        result = summarize_and_title(truncate_tokens(full_text, MAX_ARTICLE_TOKENS))
+        if result is None:
+            return None
         return {
             'original_title': article['title'],
-            'new_title': new_title,
+            'new_title': result['title'],
             'url': article['url'],
-            'summary': summary
+            'summary': result['summary']
         }
     return None
 
 def filter_relevant_articles(articles):
     logging.info("Filtering relevant articles...")
-    with ThreadPoolExecutor() as executor:
-        processed_articles = list(executor.map(process_article, articles))
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor, ProcessPoolExecutor() as parse_pool:
+        processed_articles = list(executor.map(partial(process_article, parse_pool=parse_pool), articles))
     
     summarized_articles = [article for article in processed_articles if article is not None]
 
+    # Near-duplicate articles share a cached summary; keep only the first of each
+    unique_articles = {}
+    for article in summarized_articles:
+        unique_articles.setdefault(article['summary'], article)
+    summarized_articles = list(unique_articles.values())
+
+    if not summarized_articles:
+        logging.info("No articles to filter.")
+        return []
+
     try:
-        combined_summaries = "\n\n".join([f"Title: {article['new_title']}\nSummary: {article['summary']}" for article in summarized_articles])
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {
-                    "role": "user",
-                    "content": f"Select the top 8 most relevant articles for a cybersecurity professional from the following summaries, including removing those that cover multiple news events in a single article:\n\n{combined_summaries}"
-                }
-            ],
-            stream=True,
-        )
-        relevant_titles = ""
-        for chunk in response:
-            if chunk.choices[0].delta.content is not None:
-                relevant_titles += chunk.choices[0].delta.content
-
-        relevant_articles = []
-        for article in summarized_articles:
-            if article['new_title'] in relevant_titles:
-                relevant_articles.append(article)
-                if len(relevant_articles) == 8:
-                    break
+        texts = [f"{article['new_title']}. {article['summary']}" for article in summarized_articles]
+        top = rank_by_relevance(texts, TOP_ARTICLES)
+        relevant_articles = [summarized_articles[i] for i in top]
 
         logging.info(f"Filtered down to {len(relevant_articles)} relevant articles.")
         return relevant_articles
@@ -153,43 +367,43 @@ def filter_relevant_articles(articles):
         logging.error(f"Error filtering relevant articles: {e}")
         return []
 
-def create_blog_post(summaries):
+def create_blog_post(summaries, today):
     logging.info("Creating blog post...")
-    today = datetime.now(timezone.utc).strftime('%Y-%m-%d')
-    filename = f"/root/cybersecurity-news/_posts/{today}-cybersecurity-news.md"
+    filename = os.path.join(BLOG_REPO_DIR, "_posts", f"{today}-cybersecurity-news.md")
+    parts = [f"---\ntitle: Cybersecurity News for {today}\ndate: {today}\n---\n\n"]
+    parts.extend(f"## {article['new_title']}\n[Read more]({article['url']})\n\n{article['summary']}\n\n" for article in summaries)
     try:
-        with open(filename, 'w') as f:
-            f.write(f"---\n")
-            f.write(f"title: Cybersecurity News for {today}\n")
-            f.write(f"date: {today}\n")
-            f.write(f"---\n\n")
-            for article in summaries:
-                f.write(f"## {article['new_title']}\n")
-                f.write(f"[Read more]({article['url']})\n\n")
-                f.write(f"{article['summary']}\n\n")
+        with open(filename, 'w', encoding='utf-8') as f:
+            f.write(''.join(parts))
         logging.info("Blog post created.")
     except Exception as e:
         logging.error(f"Error creating blog post: {e}")
 
 def push_to_github():
     logging.info("Pushing to GitHub...")
-    repo_dir = "/root/cybersecurity-news"
-    os.chdir(repo_dir)
     try:
-        subprocess.run(["git", "add", "."], check=True)
+        subprocess.run(["git", "add", "."], cwd=BLOG_REPO_DIR, check=True)
         
-        result = subprocess.run(["git", "status", "--porcelain"], capture_output=True, text=True)
-        if result.stdout.strip():
-            subprocess.run(["git", "commit", "-m", "Automated update of cybersecurity news"], check=True)
-            subprocess.run(["git", "push", "origin", "main"], check=True)
+        # Compares only the index to HEAD; exits 1 when something is staged
+        staged = subprocess.run(["git", "diff", "--cached", "--quiet"], cwd=BLOG_REPO_DIR)
+        if staged.returncode == 1:
+            subprocess.run(["git", "commit", "-m", "Automated update of cybersecurity news"], cwd=BLOG_REPO_DIR, check=True)
+            subprocess.run(["git", "push", "origin", "main"], cwd=BLOG_REPO_DIR, check=True)
             logging.info("Changes pushed to GitHub.")
-        else:
+        elif staged.returncode == 0:
             logging.info("No changes to commit.")
+        else:
+            logging.error(f"Error checking staged changes: git diff exited with {staged.returncode}")
     except subprocess.CalledProcessError as e:
         logging.error(f"Error during GitHub push: {e}")
 
 if __name__ == "__main__":
-    articles = fetch_top_articles()
+    # Read the clock once so the query window and post date can't straddle midnight
+    now = datetime.now(timezone.utc)
+    today = now.strftime('%Y-%m-%d')
+    yesterday = (now - timedelta(days=1)).strftime('%Y-%m-%d')
+
+    articles = preselect_articles(deduplicate_articles(fetch_top_articles(yesterday)))
     relevant_articles = filter_relevant_articles(articles)
-    create_blog_post(relevant_articles)
+    create_blog_post(relevant_articles, today)
     push_to_github()